@@ -7,6 +7,19 @@ from datetime import datetime, timedelta
 import random
 import threading
 import json
+import os
+import sys
+import logging
+import asyncio
+import atexit
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import paho.mqtt.client as mqtt
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+logger = logging.getLogger(__name__)
 
 # Page configuration - MUST BE FIRST
 st.set_page_config(
@@ -112,7 +125,8 @@ if 'sensor_data' not in st.session_state:
         'led_states': {'merah': False, 'hijau': True, 'kuning': False},
         'led_status': 'LED Hijau Menyala',
         'mqtt_connected': False,
-        'last_update': datetime.now()
+        'last_update': datetime.now(),
+        'ingested': 0
     }
 
 if 'history' not in st.session_state:
@@ -121,11 +135,149 @@ if 'history' not in st.session_state:
 if 'mqtt_initialized' not in st.session_state:
     st.session_state.mqtt_initialized = False
 
+if 'replay' not in st.session_state:
+    st.session_state.replay = {
+        'running': False,
+        'file': None,
+        'rows': 0,
+        'elapsed': 0.0,
+        'throughput': 0.0,
+        'error': None
+    }
+
+if 'rollup' not in st.session_state:
+    st.session_state.rollup = []
+
+if 'alerts' not in st.session_state:
+    st.session_state.alerts = []
+
+# Temperature thresholds and LED mapping
+BATAS_DINGIN = 22
+BATAS_PANAS = 25
+MAX_HISTORY = 50  # Keep last 50 readings
+
+LED_PER_STATUS = {
+    'Dingin': ({'merah': False, 'hijau': False, 'kuning': True}, 'LED Kuning Menyala'),
+    'Panas': ({'merah': True, 'hijau': False, 'kuning': False}, 'LED Merah Menyala'),
+    'Normal': ({'merah': False, 'hijau': True, 'kuning': False}, 'LED Hijau Menyala')
+}
+
+# MQTT broker (simulation mode when MQTT_BROKER is not set)
+MQTT_BROKER = os.environ.get('MQTT_BROKER', '')
+MQTT_PORT = int(os.environ.get('MQTT_PORT', '1883'))
+MQTT_TOPIC = os.environ.get('MQTT_TOPIC', 'dht22/data')
+
+# Background job intervals (seconds) and retention
+UPDATE_INTERVAL = 2
+ROLLUP_INTERVAL = 10
+RETENTION_INTERVAL = 60
+ROLLUP_RETENTION = timedelta(hours=1)
+ALERT_RETENTION = timedelta(hours=1)
+MAX_ALERTS = 50
+
+# Session lifecycle and per-process memory ceiling
+SESSION_CHECK_INTERVAL = 30
+SESSION_IDLE_TIMEOUT = int(os.environ.get('SESSION_IDLE_TIMEOUT', '1800'))  # Seconds
+MEMORY_LIMIT_MB = int(os.environ.get('MEMORY_LIMIT_MB', '256'))
+SESSION_ACTIVE_WINDOW = 5 * UPDATE_INTERVAL  # Seconds, never evicted for memory
+MIN_ROLLUP_MINUTES = 10  # Kept when shrinking under memory pressure
+MIN_ALERTS = 5
+
+def classify_temperature(temperature):
+    """Determine status from a single temperature"""
+    if temperature < BATAS_DINGIN:
+        return 'Dingin'
+    elif temperature > BATAS_PANAS:
+        return 'Panas'
+    return 'Normal'
+
+def humidity_level(humidity):
+    """Determine humidity level (comfort zone 40-70%)"""
+    if humidity < 40:
+        return "Rendah"
+    elif humidity < 70:
+        return "Normal"
+    return "Tinggi"
+
+def fold_rollup(minutes, readings):
+    """Fold a batch of readings into the per-minute aggregates"""
+    grouped = readings.groupby(readings['time'].dt.floor('1min')).agg(
+        n=('temperature', 'size'),
+        temperature=('temperature', 'mean'),
+        suhu_min=('temperature', 'min'),
+        suhu_max=('temperature', 'max'),
+        humidity=('humidity', 'mean')
+    )
+    
+    for row in grouped.itertuples():
+        current = minutes.get(row.Index)
+        if current is None:
+            minutes[row.Index] = {
+                'time': row.Index,
+                'n': int(row.n),
+                'temperature': float(row.temperature),
+                'suhu_min': float(row.suhu_min),
+                'suhu_max': float(row.suhu_max),
+                'humidity': float(row.humidity)
+            }
+            continue
+        n = current['n'] + int(row.n)
+        current['temperature'] = (current['temperature'] * current['n'] + row.temperature * row.n) / n
+        current['humidity'] = (current['humidity'] * current['n'] + row.humidity * row.n) / n
+        current['suhu_min'] = min(current['suhu_min'], float(row.suhu_min))
+        current['suhu_max'] = max(current['suhu_max'], float(row.suhu_max))
+        current['n'] = n
+
+def prune_rollup(minutes):
+    """Keep only the minutes within ROLLUP_RETENTION of the newest one"""
+    if not minutes:
+        return
+    oldest = max(minutes) - ROLLUP_RETENTION
+    for minute in [minute for minute in minutes if minute < oldest]:
+        del minutes[minute]
+
+def ingest_readings(session, readings):
+    """Classify a DataFrame of readings and store it in one bulk insert"""
+    sensor_data = session['sensor_data']
+    history = session['history']
+    temps = readings['temperature'].to_numpy()
+    readings = readings.assign(status=np.select(
+        [temps < BATAS_DINGIN, temps > BATAS_PANAS],
+        ['Dingin', 'Panas'],
+        default='Normal'
+    ))
+    
+    # Latest reading drives the metric cards and LEDs
+    latest = readings.iloc[-1]
+    led_states, led_status = LED_PER_STATUS[latest['status']]
+    sensor_data.update({
+        'temperature': float(latest['temperature']),
+        'humidity': float(latest['humidity']),
+        'status': latest['status'],
+        'timestamp': latest['time'].strftime('%H:%M:%S'),
+        'led_states': dict(led_states),
+        'led_status': led_status,
+        'last_update': datetime.now(),
+        'ingested': sensor_data.get('ingested', 0) + len(readings)
+    })
+    
+    # Rollups see the whole batch, before the history limit trims it
+    fold_rollup(session['minutes'], readings)
+    prune_rollup(session['minutes'])
+    
+    # Only the tail can survive the history limit
+    history.extend(readings[['time', 'temperature', 'humidity', 'status']].tail(MAX_HISTORY).to_dict('records'))
+    del history[:-MAX_HISTORY]
+
 # SIMULATOR - Generate realistic sensor data
-def sensor_simulator():
+async def sensor_simulator(core, session):
     """Simulate DHT22 sensor data"""
     while True:
-        time.sleep(2)  # Update every 2 seconds
+        await asyncio.sleep(UPDATE_INTERVAL)  # Update every 2 seconds
+        
+        # Real and recorded data have priority over the simulation
+        if core.mqtt_connected or session['replay']['running']:
+            continue
         
         # Simulate realistic temperature fluctuations
         base_temp = 24.0
@@ -137,51 +289,589 @@ def sensor_simulator():
         hum_variation = random.uniform(-5, 5)
         humidity = base_humidity + hum_variation
         
-        # Determine status
-        if temperature < 22:
-            status = 'Dingin'
-            led_states = {'merah': False, 'hijau': False, 'kuning': True}
-            led_status = 'LED Kuning Menyala'
-        elif temperature > 25:
-            status = 'Panas'
-            led_states = {'merah': True, 'hijau': False, 'kuning': False}
-            led_status = 'LED Merah Menyala'
-        else:
-            status = 'Normal'
-            led_states = {'merah': False, 'hijau': True, 'kuning': False}
-            led_status = 'LED Hijau Menyala'
+        ingest_readings(
+            session,
+            pd.DataFrame([{'time': datetime.now(), 'temperature': temperature, 'humidity': humidity}])
+        )
+
+# REPLAY - Feed recorded captures or exports through the ingestion path
+REPLAY_SPEEDS = {'1×': 1.0, '10×': 10.0, '60×': 60.0, '600×': 600.0, 'Maks': None}
+
+# Live readings use naive local time (datetime.now()), recordings are converted to match
+LOCAL_TZ = datetime.now().astimezone().tzinfo
+
+def to_local_naive(times):
+    """Drop the timezone of an aware datetime Series after converting to local time"""
+    if isinstance(times.dtype, pd.DatetimeTZDtype):
+        return times.dt.tz_convert(LOCAL_TZ).dt.tz_localize(None)
+    return times
+
+def parse_time(value):
+    """Parse one timestamp string as naive local time"""
+    parsed = pd.to_datetime(value, errors='coerce')
+    if parsed is pd.NaT or parsed.tzinfo is None:
+        return parsed
+    return parsed.tz_convert(LOCAL_TZ).tz_localize(None)
+
+def parse_times(values):
+    """Parse recorded times as naive local time; numbers are epoch seconds or ms"""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return to_local_naive(values)
+    
+    times = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    numbers = pd.to_numeric(values, errors='coerce')
+    is_epoch = numbers.notna()
+    if is_epoch.any():
+        epoch = numbers[is_epoch]
+        seconds = epoch.where(epoch < 1e11, epoch / 1000)  # Larger values are milliseconds
+        times[is_epoch] = to_local_naive(pd.to_datetime(seconds, unit='s', utc=True))
+    
+    text = values[~is_epoch]
+    if len(text):
+        try:
+            parsed = to_local_naive(pd.to_datetime(text, errors='coerce'))
+        except (ValueError, TypeError):
+            parsed = None
+        if parsed is None or not pd.api.types.is_datetime64_dtype(parsed):
+            parsed = pd.Series(pd.NaT, index=text.index, dtype='datetime64[ns]')
         
-        # Update session state
-        st.session_state.sensor_data.update({
-            'temperature': temperature,
-            'humidity': humidity,
-            'status': status,
-            'timestamp': datetime.now().strftime('%H:%M:%S'),
-            'led_states': led_states,
-            'led_status': led_status,
-            'last_update': datetime.now()
-        })
+        # Mixed offsets or naive and aware strings in one chunk come back as NaT
+        retry = parsed.isna() & text.notna()
+        if retry.any():
+            parsed[retry] = pd.to_datetime(text[retry].map(parse_time))
+        times[~is_epoch] = parsed
+    return times
+
+def decode_payload(payload):
+    """Decode one captured MQTT payload, {} when it is not a sensor reading"""
+    if isinstance(payload, str):
+        try:
+            payload = json.loads(payload)
+        except ValueError:
+            return {}
+    return payload if isinstance(payload, dict) else {}
+
+def normalize_recording(chunk):
+    """Map a raw chunk onto the history schema (time, temperature, humidity)"""
+    # MQTT capture: one message per line with the sensor JSON in 'payload'
+    if 'payload' in chunk.columns:
+        if 'topic' in chunk.columns:
+            chunk = chunk[chunk['topic'] == MQTT_TOPIC]
         
-        # Add to history (keep last 50 readings)
-        st.session_state.history.append({
+        # Other messages become empty rows and are dropped below
+        expanded = pd.DataFrame(
+            [decode_payload(p) for p in chunk['payload']],
+            index=chunk.index,
+            columns=['time', 'timestamp', 'temperature', 'humidity'],
+            dtype=object
+        )
+        expanded['time'] = expanded['time'].fillna(expanded['timestamp'])
+        for column in ('time', 'timestamp'):
+            if column in chunk.columns:
+                expanded['time'] = expanded['time'].fillna(chunk[column])
+        chunk = expanded.drop(columns='timestamp')
+    
+    if 'time' not in chunk.columns and 'timestamp' in chunk.columns:
+        chunk = chunk.rename(columns={'timestamp': 'time'})
+    
+    missing = {'time', 'temperature', 'humidity'} - set(chunk.columns)
+    if missing:
+        raise ValueError(f"Kolom tidak ditemukan: {', '.join(sorted(missing))}")
+    
+    chunk = chunk[['time', 'temperature', 'humidity']].assign(
+        time=parse_times(chunk['time']),
+        temperature=pd.to_numeric(chunk['temperature'], errors='coerce'),
+        humidity=pd.to_numeric(chunk['humidity'], errors='coerce')
+    )
+    return chunk.dropna().reset_index(drop=True)
+
+def read_recording(path, chunk_size):
+    """Yield normalized chunks without loading the whole file"""
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix == '.parquet':
+        import pyarrow.parquet as pq  # Optional, only needed for Parquet
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size):
+            yield normalize_recording(batch.to_pandas())
+    elif suffix in ('.jsonl', '.json', '.log'):
+        with pd.read_json(path, lines=True, chunksize=chunk_size, dtype=False) as reader:
+            for chunk in reader:
+                yield normalize_recording(chunk)
+    else:
+        with pd.read_csv(path, chunksize=chunk_size) as reader:
+            for chunk in reader:
+                yield normalize_recording(chunk)
+
+async def replay_worker(core, session, path, speed, chunk_size):
+    """Stream a recording at 1×, N× or max speed and track throughput"""
+    replay = session['replay']
+    started = time.perf_counter()
+    first_time = None
+    chunks = read_recording(path, chunk_size)
+    
+    def record(rows):
+        replay['rows'] += rows
+        replay['elapsed'] = time.perf_counter() - started
+        replay['throughput'] = replay['rows'] / max(replay['elapsed'], 1e-9)
+    
+    try:
+        while True:
+            # File reads run in the I/O pool so the loop stays responsive
+            chunk = await core.loop.run_in_executor(core.io_pool, next, chunks, None)
+            if chunk is None:
+                break
+            if chunk.empty:
+                continue
+            
+            # Max speed: one bulk insert per chunk
+            if speed is None:
+                ingest_readings(session, chunk)
+                record(len(chunk))
+                continue
+            
+            # Paced: insert every row that is due in one batch, then wait
+            if first_time is None:
+                first_time = chunk['time'].iloc[0]
+            offsets = (chunk['time'] - first_time).dt.total_seconds().to_numpy() / speed
+            offsets = np.maximum.accumulate(offsets)
+            i = 0
+            while i < len(chunk):
+                now = time.perf_counter() - started
+                j = int(np.searchsorted(offsets, now, side='right'))
+                if j > i:
+                    ingest_readings(session, chunk.iloc[i:j])
+                    record(j - i)
+                    i = j
+                else:
+                    await asyncio.sleep(min(offsets[i] - now, 0.5))
+    except Exception as exc:
+        replay['error'] = str(exc)
+    finally:
+        record(0)
+        replay['running'] = False
+
+# BACKGROUND JOBS - Rollups, alerts and retention for every session
+def publish_rollup(session):
+    """Copy the per-minute aggregates into the list the dashboard reads"""
+    session['rollup'][:] = [dict(row) for _, row in sorted(session['minutes'].items())]
+
+def evaluate_alerts(session):
+    """Add an alert when temperature or humidity leaves its normal range"""
+    sensor_data = session['sensor_data']
+    state = (sensor_data['status'], humidity_level(sensor_data['humidity']))
+    if state == session['alert_state']:
+        return
+    session['alert_state'] = state
+    
+    status, level = state
+    if status != 'Normal':
+        session['alerts'].append({
             'time': datetime.now(),
-            'temperature': temperature,
-            'humidity': humidity,
-            'status': status
+            'pesan': f"Suhu {status}: {sensor_data['temperature']:.1f}°C"
         })
+    if level != 'Normal':
+        session['alerts'].append({
+            'time': datetime.now(),
+            'pesan': f"Kelembaban {level}: {sensor_data['humidity']:.1f}%"
+        })
+
+def cleanup_retention(session):
+    """Drop rollups and alerts older than their retention window"""
+    prune_rollup(session['minutes'])
+    
+    alerts = session['alerts']
+    oldest = datetime.now() - ALERT_RETENTION
+    alerts[:] = [alert for alert in alerts if alert['time'] >= oldest][-MAX_ALERTS:]
+
+async def periodic(core, interval, job):
+    """Run a per-session job for every registered session at a fixed interval"""
+    while True:
+        await asyncio.sleep(interval)
+        for session in list(core.sessions.values()):
+            try:
+                job(session)
+            except Exception:
+                logger.exception("Background job %s failed", job.__name__)
+
+# MEMORY - Size estimates and LRU cache for figures and query results
+def estimate_size(obj):
+    """Approximate deep size of nested lists and dicts in bytes"""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(key) + estimate_size(value) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(estimate_size(value) for value in obj)
+    return size
+
+def cache_size(value):
+    """Size of a cached figure or DataFrame in bytes"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, go.Figure):
+        return len(value.to_json())
+    return estimate_size(value)
+
+class LRUCache:
+    """Byte-bounded LRU cache keyed by (session_id, name)"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # (session_id, name) -> (version, value, nbytes)
+        self.nbytes = 0
+    
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+    
+    def put(self, key, version, value, nbytes, budget):
+        with self.lock:
+            # A new version replaces the stale one
+            old = self.entries.pop(key, None)
+            if old:
+                self.nbytes -= old[2]
+            self.entries[key] = (version, value, nbytes)
+            self.nbytes += nbytes
+            self._shrink(budget)
+    
+    def shrink(self, budget):
+        with self.lock:
+            self._shrink(budget)
+    
+    def _shrink(self, budget):
+        while self.nbytes > budget and self.entries:
+            _, (_, _, nbytes) = self.entries.popitem(last=False)
+            self.nbytes -= nbytes
+    
+    def drop_session(self, session_id):
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == session_id]:
+                self.nbytes -= self.entries.pop(key)[2]
+
+# MQTT - Drive the paho client from the event loop
+class AsyncMQTT:
+    """Hook paho's socket callbacks into the asyncio loop"""
+    
+    def __init__(self, loop, client):
+        self.loop = loop
+        self.client = client
+        self.misc_task = None
+        client.on_socket_open = self.on_socket_open
+        client.on_socket_close = self.on_socket_close
+        client.on_socket_register_write = self.on_socket_register_write
+        client.on_socket_unregister_write = self.on_socket_unregister_write
+    
+    def on_loop(self, callback, *args):
+        """Run now on the loop thread, otherwise hand over to the loop"""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            callback(*args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+    
+    # Callbacks also fire on the I/O pool thread during connect. File
+    # descriptors are taken up front because paho closes the socket
+    # right after the close callbacks return.
+    def on_socket_open(self, client, userdata, sock):
+        self.on_loop(self.start_reading, sock.fileno())
+    
+    def on_socket_close(self, client, userdata, sock):
+        self.on_loop(self.stop_reading, sock.fileno())
+    
+    def on_socket_register_write(self, client, userdata, sock):
+        self.on_loop(self.loop.add_writer, sock.fileno(), client.loop_write)
+    
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.on_loop(self.loop.remove_writer, sock.fileno())
+    
+    def start_reading(self, fd):
+        self.loop.add_reader(fd, self.client.loop_read)
+        self.misc_task = self.loop.create_task(self.misc_loop())
+    
+    def stop_reading(self, fd):
+        self.loop.remove_reader(fd)
+        if self.misc_task:
+            self.misc_task.cancel()
+    
+    async def misc_loop(self):
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+# INGESTION CORE - One event loop thread shared by all sessions
+class IngestionCore:
+    """Run MQTT, simulators, replays and background jobs as asyncio tasks"""
+    
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.io_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='ingestion-io')
+        self.sessions = {}
+        self.cache = LRUCache()
+        self.memory_limit = MEMORY_LIMIT_MB * 1024 * 1024
+        self.mqtt_connected = False
+        self.mqtt_client = None
+        self.thread = threading.Thread(target=self.loop.run_forever, name='ingestion-core', daemon=True)
+        self.thread.start()
+        self.loop.call_soon_threadsafe(self._start_jobs)
+    
+    def _start_jobs(self):
+        self.loop.create_task(periodic(self, ROLLUP_INTERVAL, publish_rollup))
+        self.loop.create_task(periodic(self, UPDATE_INTERVAL, evaluate_alerts))
+        self.loop.create_task(periodic(self, RETENTION_INTERVAL, cleanup_retention))
+        self.loop.create_task(self.session_reaper())
+        if MQTT_BROKER:
+            self.loop.create_task(self.mqtt_worker())
+    
+    def register(self, session_id, state):
+        """Attach a browser session and start its simulator"""
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session['last_seen'] = time.monotonic()
+            return
+        session = {
+            'sensor_data': state.sensor_data,
+            'history': state.history,
+            'replay': state.replay,
+            'rollup': state.rollup,
+            'alerts': state.alerts,
+            'minutes': {row['time']: dict(row) for row in state.rollup},
+            'alert_state': None,
+            'tasks': {},
+            'last_seen': time.monotonic(),
+            'bytes': 0
+        }
+        # self.sessions is only changed on the loop thread
+        self.loop.call_soon_threadsafe(self._register, session_id, session)
+    
+    def _register(self, session_id, session):
+        if session_id in self.sessions:
+            return
+        session['sensor_data']['mqtt_connected'] = self.mqtt_connected
+        self.sessions[session_id] = session
+        self._start_task(session, 'simulator', sensor_simulator(self, session))
+    
+    def _start_task(self, session, name, coro):
+        task = self.loop.create_task(coro)
+        task.add_done_callback(lambda task: self._task_done(session, name, task))
+        session['tasks'][name] = task
+    
+    def _task_done(self, session, name, task):
+        if session['tasks'].get(name) is not task:
+            return
+        del session['tasks'][name]
+        # A replay cancelled before its first step never reaches its finally
+        if name == 'replay':
+            session['replay']['running'] = False
+    
+    def start_replay(self, session_id, path, speed, chunk_size):
+        """Replay a recording into one session"""
+        self.loop.call_soon_threadsafe(self._start_replay, session_id, path, speed, chunk_size)
+    
+    def _start_replay(self, session_id, path, speed, chunk_size):
+        session = self.sessions.get(session_id)
+        # Ignore repeated requests (e.g. a double click) while one is running
+        if session is None or 'replay' in session['tasks']:
+            return
+        session['replay'].update({
+            'running': True,
+            'file': os.path.basename(path),
+            'rows': 0,
+            'elapsed': 0.0,
+            'throughput': 0.0,
+            'error': None
+        })
+        self._start_task(session, 'replay', replay_worker(self, session, path, speed, chunk_size))
+    
+    def stop_replay(self, session_id):
+        """Cancel the running replay of one session"""
+        self.loop.call_soon_threadsafe(self._cancel_task, session_id, 'replay')
+    
+    def _cancel_task(self, session_id, name):
+        session = self.sessions.get(session_id)
+        task = session and session['tasks'].get(name)
+        if task:
+            task.cancel()
+    
+    def cached(self, session_id, name, version, build):
+        """Return a cached figure or query result, building it when stale"""
+        key = (session_id, name)
+        value = self.cache.get(key, version)
+        if value is None:
+            value = build()
+            budget = self.memory_limit - self.session_bytes()
+            self.cache.put(key, version, value, cache_size(value), budget)
+        return value
+    
+    def session_bytes(self):
+        return sum(session['bytes'] for session in list(self.sessions.values()))
+    
+    def memory_usage(self):
+        """Tracked bytes for session buffers and the cache, and the ceiling"""
+        sessions = self.session_bytes()
+        return {
+            'sessions': sessions,
+            'cache': self.cache.nbytes,
+            'total': sessions + self.cache.nbytes,
+            'limit': self.memory_limit
+        }
+    
+    def is_disconnected(self, session_id):
+        if not runtime.exists():
+            return False
+        return not runtime.get_instance().is_active_session(session_id)
+    
+    def measure_session(self, session):
+        session['bytes'] = (
+            estimate_size(session['history'])
+            + estimate_size(session['rollup'])
+            + estimate_size(list(session['minutes'].values()))
+            + estimate_size(session['alerts'])
+        )
+    
+    def shrink_session(self, session):
+        """Cut a session's rollups and alerts down to the most recent entries"""
+        minutes = session['minutes']
+        for minute in sorted(minutes)[:-MIN_ROLLUP_MINUTES]:
+            del minutes[minute]
+        publish_rollup(session)
+        del session['alerts'][:-MIN_ALERTS]
+        self.measure_session(session)
+    
+    def is_active(self, session, now):
+        """Sessions that reran recently or are replaying are in use"""
+        return 'replay' in session['tasks'] or now - session['last_seen'] < SESSION_ACTIVE_WINDOW
+    
+    def evict_session(self, session_id, reason):
+        """Stop a session's workers and free its buffers"""
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            return
+        # Shown to the user if the tab reruns
+        session['sensor_data']['evicted'] = {'alasan': reason, 'time': datetime.now()}
+        for task in list(session['tasks'].values()):
+            task.cancel()
+        session['history'].clear()
+        session['rollup'].clear()
+        session['minutes'].clear()
+        session['alerts'].clear()
+        self.cache.drop_session(session_id)
+    
+    async def session_reaper(self):
+        """Evict disconnected or idle sessions and enforce the memory ceiling"""
+        while True:
+            await asyncio.sleep(SESSION_CHECK_INTERVAL)
+            now = time.monotonic()
+            for session_id, session in list(self.sessions.items()):
+                if self.is_disconnected(session_id):
+                    self.evict_session(session_id, "koneksi terputus")
+                    continue
+                # A running replay counts as activity
+                idle = now - session['last_seen'] > SESSION_IDLE_TIMEOUT
+                if idle and 'replay' not in session['tasks']:
+                    self.evict_session(session_id, "tidak aktif")
+                    continue
+                self.measure_session(session)
+            
+            # Over the ceiling: cached figures and query results go first,
+            # then the sessions' own rollups and alerts
+            self.cache.shrink(self.memory_limit - self.session_bytes())
+            by_last_seen = sorted(self.sessions.values(), key=lambda session: session['last_seen'])
+            for session in by_last_seen:
+                if self.session_bytes() <= self.memory_limit:
+                    break
+                self.shrink_session(session)
+            
+            # Last resort: least recently seen sessions that are not in use
+            while self.session_bytes() > self.memory_limit:
+                idle_sessions = [sid for sid, session in self.sessions.items() if not self.is_active(session, now)]
+                if not idle_sessions:
+                    logger.warning("Memory ceiling of %.0f MB exceeded by sessions in use", self.memory_limit / 1024 / 1024)
+                    break
+                session_id = min(idle_sessions, key=lambda sid: self.sessions[sid]['last_seen'])
+                self.evict_session(session_id, "batas memori")
+    
+    async def mqtt_worker(self):
+        """Keep the MQTT connection alive and fan readings out to sessions"""
+        client = mqtt.Client()
+        client.on_connect = self.on_mqtt_connect
+        client.on_message = self.on_mqtt_message
+        client.on_disconnect = self.on_mqtt_disconnect
+        AsyncMQTT(self.loop, client)
+        self.mqtt_client = client
         
-        if len(st.session_state.history) > 50:
-            st.session_state.history.pop(0)
-        
-        # Trigger rerun if in auto-refresh mode
-        if st.session_state.get('auto_refresh', True):
-            st.rerun()
+        while True:
+            self.mqtt_disconnected = self.loop.create_future()
+            try:
+                # DNS and TCP connect block, so they run in the I/O pool
+                await self.loop.run_in_executor(self.io_pool, client.connect, MQTT_BROKER, MQTT_PORT, 60)
+            except OSError:
+                logger.exception("MQTT connect to %s:%s failed", MQTT_BROKER, MQTT_PORT)
+            else:
+                await self.mqtt_disconnected
+            await asyncio.sleep(5)  # Reconnect delay
+    
+    def set_mqtt_connected(self, connected):
+        self.mqtt_connected = connected
+        for session in list(self.sessions.values()):
+            session['sensor_data']['mqtt_connected'] = connected
+    
+    def on_mqtt_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            client.subscribe(MQTT_TOPIC)
+            self.set_mqtt_connected(True)
+    
+    def on_mqtt_disconnect(self, client, userdata, rc):
+        self.set_mqtt_connected(False)
+        if not self.mqtt_disconnected.done():
+            self.mqtt_disconnected.set_result(rc)
+    
+    def on_mqtt_message(self, client, userdata, msg):
+        try:
+            payload = json.loads(msg.payload)
+            reading = pd.DataFrame([{
+                'time': datetime.now(),
+                'temperature': float(payload['temperature']),
+                'humidity': float(payload['humidity'])
+            }])
+        except (ValueError, KeyError, TypeError):
+            return
+        for session in list(self.sessions.values()):
+            if not session['replay']['running']:
+                ingest_readings(session, reading)
+    
+    async def _shutdown(self):
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self.mqtt_client:
+            self.mqtt_client.disconnect()
+    
+    def shutdown(self):
+        """Cancel every task, then stop the loop and its threads"""
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(timeout=5)
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout=5)
+            self.io_pool.shutdown(wait=False, cancel_futures=True)
 
-# Start simulator thread
-if 'sim_thread' not in st.session_state:
-    sim_thread = threading.Thread(target=sensor_simulator, daemon=True)
-    sim_thread.start()
-    st.session_state.sim_thread = sim_thread
+@st.cache_resource
+def get_ingestion_core():
+    """Create the process-wide ingestion core once"""
+    core = IngestionCore()
+    atexit.register(core.shutdown)
+    return core
+
+# Attach this session to the ingestion core
+core = get_ingestion_core()
+session_id = get_script_run_ctx().session_id
+core.register(session_id, st.session_state)
 
 # Sidebar
 with st.sidebar:
@@ -231,24 +921,14 @@ with st.sidebar:
     
     if st.button("💾 Simpan Data Manual", type="secondary", use_container_width=True):
         # Determine status based on manual input
-        if manual_temp < 22:
-            status = 'Dingin'
-            led_states = {'merah': False, 'hijau': False, 'kuning': True}
-            led_status = 'LED Kuning Menyala'
-        elif manual_temp > 25:
-            status = 'Panas'
-            led_states = {'merah': True, 'hijau': False, 'kuning': False}
-            led_status = 'LED Merah Menyala'
-        else:
-            status = 'Normal'
-            led_states = {'merah': False, 'hijau': True, 'kuning': False}
-            led_status = 'LED Hijau Menyala'
+        status = classify_temperature(manual_temp)
+        led_states, led_status = LED_PER_STATUS[status]
         
         st.session_state.sensor_data.update({
             'temperature': manual_temp,
             'humidity': manual_hum,
             'status': status,
-            'led_states': led_states,
+            'led_states': dict(led_states),
             'led_status': led_status,
             'timestamp': datetime.now().strftime('%H:%M:%S'),
             'last_update': datetime.now()
@@ -291,6 +971,54 @@ with st.sidebar:
             st.session_state.sensor_data['led_status'] = 'Semua LED Mati'
             st.rerun()
     
+    # Replay recorded data
+    st.markdown("### 📼 Replay Data Rekaman")
+    replay_path = st.text_input(
+        "Path file rekaman",
+        placeholder="rekaman/sensor.csv",
+        help="CSV/Parquet (kolom time, temperature, humidity) atau capture MQTT (JSON Lines)",
+        key="replay_path"
+    )
+    col1, col2 = st.columns(2)
+    with col1:
+        replay_speed = st.selectbox("Kecepatan", list(REPLAY_SPEEDS), key="replay_speed")
+    with col2:
+        replay_chunk = st.number_input(
+            "Ukuran Chunk",
+            min_value=1000,
+            max_value=1000000,
+            value=50000,
+            step=1000,
+            key="replay_chunk"
+        )
+    
+    replay = st.session_state.replay
+    if replay['running']:
+        if st.button("⏹️ Hentikan Replay", type="secondary", use_container_width=True):
+            core.stop_replay(session_id)
+            st.rerun()
+    elif st.button("▶️ Mulai Replay", type="primary", use_container_width=True):
+        if not os.path.isfile(replay_path):
+            st.error("File rekaman tidak ditemukan!")
+        else:
+            core.start_replay(session_id, replay_path, REPLAY_SPEEDS[replay_speed], int(replay_chunk))
+            st.rerun()
+    
+    if replay['file']:
+        state_text = "Berjalan" if replay['running'] else "Selesai"
+        st.caption(f"**{replay['file']}:** {state_text} • {replay['rows']:,} baris • {replay['elapsed']:.1f} detik")
+        st.caption(f"**Throughput:** {replay['throughput']:,.0f} baris/detik")
+    if replay['error']:
+        st.error(f"Replay gagal: {replay['error']}")
+    
+    # Alerts from the alert evaluation job
+    st.markdown("### 🚨 Peringatan")
+    if st.session_state.alerts:
+        for alert in st.session_state.alerts[-5:][::-1]:
+            st.caption(f"**{alert['time'].strftime('%H:%M:%S')}** • {alert['pesan']}")
+    else:
+        st.caption("Tidak ada peringatan")
+    
     # Clear history
     if st.button("🗑️ Hapus Riwayat", type="secondary", use_container_width=True):
         st.session_state.history.clear()
@@ -305,11 +1033,22 @@ with st.sidebar:
     st.caption("**Range Normal:** 22°C - 25°C")
     st.caption("**Update Interval:** 2 detik")
     st.caption(f"**Data Points:** {len(st.session_state.history)}")
+    st.caption(f"**Sesi Aktif:** {len(core.sessions)} • **Thread:** {threading.active_count()}")
+    
+    memory = core.memory_usage()
+    st.caption(f"**Memori:** {memory['total'] / 1024 / 1024:.1f} MB / {memory['limit'] / 1024 / 1024:.0f} MB")
+    st.progress(min(memory['total'] / memory['limit'], 1.0))
+    st.caption(f"**Buffer Sesi:** {memory['sessions'] / 1024:.0f} KB • **Cache:** {memory['cache'] / 1024:.0f} KB ({len(core.cache.entries)} item)")
 
 # Main dashboard
 st.markdown('<h1 class="main-header">🌡️ Dashboard Monitoring Suhu DHT22</h1>', unsafe_allow_html=True)
 st.markdown('<p style="text-align: center; color: #666; margin-bottom: 2rem;">Update Real-time • Sistem IoT • ESP32 + DHT22</p>', unsafe_allow_html=True)
 
+# Notice when the session reaper freed this session's data
+evicted = st.session_state.sensor_data.get('evicted')
+if evicted and (datetime.now() - evicted['time']).total_seconds() < 60:
+    st.warning(f"⚠️ Data sesi ini dibersihkan otomatis ({evicted['alasan']}) pada {evicted['time'].strftime('%H:%M:%S')}. Riwayat, rollup, dan peringatan dimulai ulang.")
+
 # Row 1: Metrics
 col1, col2, col3, col4 = st.columns(4)
 
@@ -350,12 +1089,7 @@ with col2:
     st.progress(progress, text=f"{int(humidity)}%")
     
     # Humidity level indicator
-    if humidity < 40:
-        level = "Rendah"
-    elif humidity < 70:
-        level = "Normal"
-    else:
-        level = "Tinggi"
+    level = humidity_level(humidity)
     
     st.markdown(f'<p style="color: rgba(255,255,255,0.8); margin: 5px 0 0 0;">Level: <strong>{level}</strong></p>', unsafe_allow_html=True)
     st.markdown('</div>', unsafe_allow_html=True)
@@ -421,12 +1155,126 @@ with col4:
     
     st.markdown('</div>', unsafe_allow_html=True)
 
+# CHARTS - Figures and tables are cached per session in the LRU cache
+def build_temperature_figure(times, temps, statuses):
+    """Temperature chart with thresholds and status background"""
+    # Create temperature chart
+    fig_temp = go.Figure()
+    
+    # Add temperature line
+    fig_temp.add_trace(go.Scatter(
+        x=times,
+        y=temps,
+        mode='lines+markers',
+        name='Suhu',
+        line=dict(color='#4361ee', width=3),
+        marker=dict(size=6, color='#4361ee'),
+        hovertemplate='<b>%{x:%H:%M:%S}</b><br>Suhu: %{y:.1f}°C<extra></extra>'
+    ))
+    
+    # Add threshold lines
+    fig_temp.add_hline(
+        y=22,
+        line_dash="dash",
+        line_color="blue",
+        annotation_text="Batas Dingin (22°C)",
+        annotation_position="bottom right"
+    )
+    
+    fig_temp.add_hline(
+        y=25,
+        line_dash="dash", 
+        line_color="red",
+        annotation_text="Batas Panas (25°C)",
+        annotation_position="top right"
+    )
+    
+    # Color background based on status
+    for i in range(len(times)-1):
+        color = {
+            'Dingin': 'rgba(76, 201, 240, 0.1)',
+            'Normal': 'rgba(74, 222, 128, 0.1)',
+            'Panas': 'rgba(247, 37, 133, 0.1)'
+        }.get(statuses[i], 'rgba(0,0,0,0.1)')
+    
+        fig_temp.add_shape(
+            type="rect",
+            x0=times[i],
+            x1=times[i+1],
+            y0=min(temps)-2,
+            y1=max(temps)+2,
+            fillcolor=color,
+            opacity=0.3,
+            layer="below",
+            line_width=0
+        )
+    
+    fig_temp.update_layout(
+        title='Riwayat Suhu (°C) - Real-time',
+        xaxis_title='Waktu',
+        yaxis_title='Suhu (°C)',
+        template='plotly_white',
+        height=400,
+        hovermode='x unified',
+        showlegend=True
+    )
+    
+    return fig_temp
+
+def build_humidity_figure(times, hums):
+    """Humidity chart with the comfort zone"""
+    fig_hum = go.Figure()
+    fig_hum.add_trace(go.Scatter(
+        x=times,
+        y=hums,
+        mode='lines+markers',
+        name='Kelembaban',
+        line=dict(color='#4cc9f0', width=3),
+        marker=dict(size=6, color='#4cc9f0'),
+        hovertemplate='<b>%{x:%H:%M:%S}</b><br>Kelembaban: %{y:.1f}%<extra></extra>'
+    ))
+    
+    # Add humidity comfort zones
+    fig_hum.add_hrect(
+        y0=40, y1=70,
+        fillcolor="rgba(76, 201, 240, 0.1)",
+        line_width=0,
+        annotation_text="Zona Nyaman (40-70%)",
+        annotation_position="top left"
+    )
+    
+    fig_hum.update_layout(
+        title='Riwayat Kelembaban (%) - Real-time',
+        xaxis_title='Waktu',
+        yaxis_title='Kelembaban (%)',
+        template='plotly_white',
+        height=400,
+        hovermode='x unified'
+    )
+    
+    return fig_hum
+
+def build_history_table(history):
+    """History rows formatted for display, latest first"""
+    df = pd.DataFrame(history)
+    df['Waktu'] = df['time'].dt.strftime('%H:%M:%S')
+    df['Suhu (°C)'] = df['temperature'].round(1)
+    df['Kelembaban (%)'] = df['humidity'].round(1)
+    df['Status'] = df['status']
+    
+    # Show latest first
+    df_display = df[['Waktu', 'Suhu (°C)', 'Kelembaban (%)', 'Status']].iloc[::-1]
+    return df_display
+
 # Row 2: Charts
 st.markdown("## 📈 Grafik Monitoring Real-time")
 
 if st.session_state.history:
+    # Cached figures and tables stay valid until new data arrives
+    history_version = (st.session_state.sensor_data['ingested'], len(st.session_state.history))
+    
     # Create tabs for different charts
-    tab1, tab2, tab3 = st.tabs(["📊 Grafik Suhu", "💧 Grafik Kelembaban", "📋 Data Riwayat"])
+    tab1, tab2, tab3, tab4 = st.tabs(["📊 Grafik Suhu", "💧 Grafik Kelembaban", "📋 Data Riwayat", "⏱️ Rollup per Menit"])
     
     with tab1:
         # Prepare data for temperature chart
@@ -435,65 +1283,7 @@ if st.session_state.history:
         statuses = [h['status'] for h in st.session_state.history]
         
         # Create temperature chart
-        fig_temp = go.Figure()
-        
-        # Add temperature line
-        fig_temp.add_trace(go.Scatter(
-            x=times,
-            y=temps,
-            mode='lines+markers',
-            name='Suhu',
-            line=dict(color='#4361ee', width=3),
-            marker=dict(size=6, color='#4361ee'),
-            hovertemplate='<b>%{x:%H:%M:%S}</b><br>Suhu: %{y:.1f}°C<extra></extra>'
-        ))
-        
-        # Add threshold lines
-        fig_temp.add_hline(
-            y=22,
-            line_dash="dash",
-            line_color="blue",
-            annotation_text="Batas Dingin (22°C)",
-            annotation_position="bottom right"
-        )
-        
-        fig_temp.add_hline(
-            y=25,
-            line_dash="dash", 
-            line_color="red",
-            annotation_text="Batas Panas (25°C)",
-            annotation_position="top right"
-        )
-        
-        # Color background based on status
-        for i in range(len(times)-1):
-            color = {
-                'Dingin': 'rgba(76, 201, 240, 0.1)',
-                'Normal': 'rgba(74, 222, 128, 0.1)',
-                'Panas': 'rgba(247, 37, 133, 0.1)'
-            }.get(statuses[i], 'rgba(0,0,0,0.1)')
-            
-            fig_temp.add_shape(
-                type="rect",
-                x0=times[i],
-                x1=times[i+1],
-                y0=min(temps)-2,
-                y1=max(temps)+2,
-                fillcolor=color,
-                opacity=0.3,
-                layer="below",
-                line_width=0
-            )
-        
-        fig_temp.update_layout(
-            title='Riwayat Suhu (°C) - Real-time',
-            xaxis_title='Waktu',
-            yaxis_title='Suhu (°C)',
-            template='plotly_white',
-            height=400,
-            hovermode='x unified',
-            showlegend=True
-        )
+        fig_temp = core.cached(session_id, 'fig_temp', history_version, lambda: build_temperature_figure(times, temps, statuses))
         
         st.plotly_chart(fig_temp, use_container_width=True)
         
@@ -514,34 +1304,7 @@ if st.session_state.history:
         # Humidity chart
         hums = [h['humidity'] for h in st.session_state.history]
         
-        fig_hum = go.Figure()
-        fig_hum.add_trace(go.Scatter(
-            x=times,
-            y=hums,
-            mode='lines+markers',
-            name='Kelembaban',
-            line=dict(color='#4cc9f0', width=3),
-            marker=dict(size=6, color='#4cc9f0'),
-            hovertemplate='<b>%{x:%H:%M:%S}</b><br>Kelembaban: %{y:.1f}%<extra></extra>'
-        ))
-        
-        # Add humidity comfort zones
-        fig_hum.add_hrect(
-            y0=40, y1=70,
-            fillcolor="rgba(76, 201, 240, 0.1)",
-            line_width=0,
-            annotation_text="Zona Nyaman (40-70%)",
-            annotation_position="top left"
-        )
-        
-        fig_hum.update_layout(
-            title='Riwayat Kelembaban (%) - Real-time',
-            xaxis_title='Waktu',
-            yaxis_title='Kelembaban (%)',
-            template='plotly_white',
-            height=400,
-            hovermode='x unified'
-        )
+        fig_hum = core.cached(session_id, 'fig_hum', history_version, lambda: build_humidity_figure(times, hums))
         
         st.plotly_chart(fig_hum, use_container_width=True)
         
@@ -558,14 +1321,7 @@ if st.session_state.history:
     with tab3:
         # Data table
         if st.session_state.history:
-            df = pd.DataFrame(st.session_state.history)
-            df['Waktu'] = df['time'].dt.strftime('%H:%M:%S')
-            df['Suhu (°C)'] = df['temperature'].round(1)
-            df['Kelembaban (%)'] = df['humidity'].round(1)
-            df['Status'] = df['status']
-            
-            # Show latest first
-            df_display = df[['Waktu', 'Suhu (°C)', 'Kelembaban (%)', 'Status']].iloc[::-1]
+            df_display = core.cached(session_id, 'history_table', history_version, lambda: build_history_table(st.session_state.history))
             
             st.dataframe(
                 df_display,
@@ -594,6 +1350,29 @@ if st.session_state.history:
             with col2:
                 if st.button("🔄 Refresh Data", use_container_width=True):
                     st.rerun()
+    
+    with tab4:
+        # Per-minute aggregates from the rollup job
+        if st.session_state.rollup:
+            df_rollup = pd.DataFrame(st.session_state.rollup).iloc[::-1]
+            df_rollup['Menit'] = df_rollup['time'].dt.strftime('%H:%M')
+            
+            st.dataframe(
+                df_rollup[['Menit', 'n', 'temperature', 'suhu_min', 'suhu_max', 'humidity']],
+                use_container_width=True,
+                height=400,
+                hide_index=True,
+                column_config={
+                    "Menit": st.column_config.TextColumn("Menit", width="small"),
+                    "n": st.column_config.NumberColumn("Jumlah Data"),
+                    "temperature": st.column_config.NumberColumn("Suhu Rata-rata (°C)", format="%.1f"),
+                    "suhu_min": st.column_config.NumberColumn("Suhu Min (°C)", format="%.1f"),
+                    "suhu_max": st.column_config.NumberColumn("Suhu Max (°C)", format="%.1f"),
+                    "humidity": st.column_config.NumberColumn("Kelembaban Rata-rata (%)", format="%.1f")
+                }
+            )
+        else:
+            st.info(f"Rollup dihitung setiap {ROLLUP_INTERVAL} detik.")
 else:
     # No data yet
     st.info("⏳ Menunggu data sensor... Data akan muncul dalam beberapa detik.")
@@ -615,7 +1394,7 @@ with col1:
         "🌐 Jenis Dashboard": "Streamlit Real-time",
         "📡 Sensor": "DHT22 (Temperature & Humidity)",
         "⚡ Mikrokontroller": "ESP32",
-        "☁️ Protokol Komunikasi": "MQTT (Simulasi)",
+        "☁️ Protokol Komunikasi": "MQTT (Terhubung)" if st.session_state.sensor_data['mqtt_connected'] else "MQTT (Simulasi)",
         "📊 Update Interval": "2 detik",
         "💾 Data History": f"{len(st.session_state.history)} titik data"
     }